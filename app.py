@@ -1,11 +1,17 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+from bisect import bisect_right
 from datetime import datetime
+from string import Template
+import io
 import math
 import json
 
+from kernels import amortization_balances, annuity_factor, pmt
+
 # Page configuration
 st.set_page_config(
     page_title="🏠 House Affordability Calculator",
@@ -13,6 +19,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Cache limits, shared by the cached functions and the debug panel
+_AMORTIZATION_CACHE_ENTRIES = 32
+_AMORTIZATION_CACHE_TTL = 600  # seconds
+_MORTGAGE_CACHE_ENTRIES = 64
+
 # Utility functions
 def to_currency(amount):
     """Format number as currency"""
@@ -30,48 +41,46 @@ def safe_divide(numerator, denominator):
     """Safe division that returns 0 if denominator is 0"""
     return numerator / denominator if denominator != 0 else 0
 
-def pmt(rate, nper, pv):
-    """Calculate monthly payment using standard mortgage formula"""
-    if rate == 0:
-        return pv / nper
-    return rate * pv / (1 - (1 + rate) ** -nper)
-
-def invert_pmt(payment, rate, nper):
-    """Calculate loan amount from monthly payment"""
-    if rate == 0:
-        return payment * nper
-    return payment * (1 - (1 + rate) ** -nper) / rate
-
-@st.cache_data
+@st.cache_data(max_entries=_AMORTIZATION_CACHE_ENTRIES, ttl=_AMORTIZATION_CACHE_TTL,
+               show_spinner=False)
 def make_amortization_schedule(loan_amount, annual_rate, years):
     """Create amortization schedule"""
     monthly_rate = annual_rate / 100 / 12
     total_months = int(years * 12)
     monthly_payment = pmt(monthly_rate, total_months, loan_amount)
     
-    schedule = []
-    balance = loan_amount
-    cumulative_interest = 0
-    
-    for month in range(1, total_months + 1):
-        interest = balance * monthly_rate
-        principal = monthly_payment - interest
-        balance = max(0, balance - principal)
-        cumulative_interest += interest
-        
-        schedule.append({
-            'Month': month,
-            'Beginning Balance': balance + principal,
-            'Interest': interest,
-            'Principal': principal,
-            'Ending Balance': balance,
-            'Cumulative Interest': cumulative_interest
-        })
-        
-        if balance <= 0:
-            break
-    
-    return pd.DataFrame(schedule)
+    months = np.arange(1, total_months + 1)
+    ending = amortization_balances(float(loan_amount), monthly_rate, monthly_payment, total_months)
+    
+    # Stop at the first month the loan is paid off
+    paid_off = np.searchsorted(-ending, 0)
+    n = min(paid_off + 1, total_months)
+    months = months[:n]
+    ending = ending[:n]
+    
+    beginning = np.concatenate(([loan_amount], ending[:-1]))
+    interest = beginning * monthly_rate
+    principal = monthly_payment - interest
+    
+    # Month fits in int32; money stays float64 since float32 can't hold cents
+    # above ~$167k
+    return pd.DataFrame({
+        'Month': months.astype(np.int32),
+        'Beginning Balance': beginning,
+        'Interest': interest,
+        'Principal': principal,
+        'Ending Balance': np.clip(ending, 0, None),
+        'Cumulative Interest': np.cumsum(interest)
+    })
+
+# Credit score band risk factors used by the risk score (lower score = higher risk)
+_CREDIT_RISK = {
+    "760+": 0.1,
+    "720-759": 0.3,
+    "680-719": 0.5,
+    "640-679": 0.7,
+    "Under 640": 1.0
+}
 
 def calculate_risk_score(back_end_dti, ltv, credit_score_band):
     """Calculate risk score (0-100) based on weighted factors"""
@@ -82,29 +91,24 @@ def calculate_risk_score(back_end_dti, ltv, credit_score_band):
     ltv_risk = min(ltv / 1.0, 1.0)  # Scale so 100% LTV = max risk
     
     # Credit score risk (20% weight) - lower score = higher risk
-    credit_risks = {
-        "760+": 0.1,
-        "720-759": 0.3,
-        "680-719": 0.5,
-        "640-679": 0.7,
-        "Under 640": 1.0
-    }
-    credit_risk = credit_risks.get(credit_score_band, 0.5)
+    credit_risk = _CREDIT_RISK.get(credit_score_band, 0.5)
     
     # Weighted combination
     risk_score = (dti_risk * 0.5 + ltv_risk * 0.3 + credit_risk * 0.2) * 100
     return min(100, max(0, risk_score))
 
+# Risk labels and colors, split at the score thresholds in _RISK_BINS
+_RISK_BINS = (25, 50, 75)
+_RISK_TABLE = (
+    ("Low", "#28a745"),
+    ("Moderate", "#ffc107"),
+    ("High", "#fd7e14"),
+    ("Very High", "#dc3545")
+)
+
 def get_risk_label_and_color(risk_score):
     """Get risk label and color based on score"""
-    if risk_score < 25:
-        return "Low", "#28a745"
-    elif risk_score < 50:
-        return "Moderate", "#ffc107"
-    elif risk_score < 75:
-        return "High", "#fd7e14"
-    else:
-        return "Very High", "#dc3545"
+    return _RISK_TABLE[bisect_right(_RISK_BINS, risk_score)]
 
 def get_risk_guidance(risk_label, ltv, back_end_dti):
     """Provide risk-specific guidance"""
@@ -121,6 +125,171 @@ def get_risk_guidance(risk_label, ltv, back_end_dti):
     else:
         return "🚨 High risk - strongly consider improving financial position first"
 
+@st.cache_data(max_entries=_MORTGAGE_CACHE_ENTRIES)
+def compute_mortgage(annual_income, existing_debt, credit_score, home_price,
+                     down_payment_amount, down_payment_percent, interest_rate, loan_term,
+                     property_tax_rate, home_insurance, hoa_fees, pmi_rate,
+                     max_front_dti, max_back_dti):
+    """Calculate payments, DTI, LTV and risk for a set price, or the max
+    affordable price when home_price is None"""
+    monthly_income = annual_income / 12
+
+    # Max payment based on DTI constraints (also drives the rate sensitivity chart)
+    max_payment_front = monthly_income * max_front_dti
+    max_payment_back = monthly_income * max_back_dti - existing_debt
+    max_payment_constraint = min(max_payment_front, max_payment_back)
+
+    # Ensure positive payment constraint
+    if max_payment_constraint <= 0:
+        max_payment_constraint = 1000  # Minimum payment to prevent errors
+
+    # Annuity factor shared by every payment at the chosen rate and term
+    monthly_rate = interest_rate / 100 / 12
+    total_months = loan_term * 12
+    annuity = annuity_factor(monthly_rate, total_months)
+
+    # Calculate based on mode
+    if home_price:
+        # User set price - calculate affordability
+        loan_amount = home_price - down_payment_amount
+    
+        # Monthly P&I
+        monthly_pi = loan_amount / annuity
+    
+        # Other monthly costs
+        monthly_tax = home_price * property_tax_rate / 100 / 12
+        monthly_insurance = home_insurance / 12
+        monthly_hoa = hoa_fees
+    
+        # PMI if down payment < 20%
+        monthly_pmi = 0
+        if down_payment_percent < 20:
+            monthly_pmi = loan_amount * pmi_rate / 100 / 12
+    
+        total_monthly_payment = monthly_pi + monthly_tax + monthly_insurance + monthly_hoa + monthly_pmi
+    
+        # DTI calculations
+        front_end_dti = total_monthly_payment / monthly_income
+        back_end_dti = (total_monthly_payment + existing_debt) / monthly_income
+    
+        # LTV
+        ltv = loan_amount / home_price
+    
+        max_affordable_price = home_price  # Same as set price
+    
+    else:
+        # Find maximum affordability
+        # Solve for price in closed form. Every cost is linear in price P:
+        #   PI  = pi_factor * (P - DP)
+        #   PMI = pmi_factor * (P - DP)   (only when DP / P < 20%)
+        #   Tax = tax_factor * P
+        # so max_payment = (pi_factor + pmi_factor) * (P - DP) + tax_factor * P + fixed
+        fixed_costs = home_insurance / 12 + hoa_fees
+        pi_factor = 1 / annuity
+        tax_factor = property_tax_rate / 100 / 12
+        pmi_factor = pmi_rate / 100 / 12
+        pmi_threshold_price = down_payment_amount / 0.20  # PMI applies above this price
+    
+        available = max_payment_constraint - fixed_costs
+        price_with_pmi = ((available + (pi_factor + pmi_factor) * down_payment_amount)
+                          / (pi_factor + pmi_factor + tax_factor))
+        price_without_pmi = ((available + pi_factor * down_payment_amount)
+                             / (pi_factor + tax_factor))
+    
+        # Pick whichever solution is consistent with its PMI assumption; if neither
+        # is, the budget lands exactly on the 20% down payment boundary
+        if price_with_pmi > pmi_threshold_price:
+            estimated_price = price_with_pmi
+        elif price_without_pmi <= pmi_threshold_price:
+            estimated_price = price_without_pmi
+        else:
+            estimated_price = pmi_threshold_price
+    
+        # Set calculated values
+        home_price = max(estimated_price, down_payment_amount + 1000)
+        max_affordable_price = home_price
+        loan_amount = home_price - down_payment_amount
+    
+        # Recalculate final values at the solved price
+        monthly_pi = loan_amount / annuity
+        monthly_tax = home_price * property_tax_rate / 100 / 12
+        monthly_insurance = home_insurance / 12
+        monthly_hoa = hoa_fees
+    
+        monthly_pmi = 0
+        if down_payment_amount / home_price < 0.20:
+            monthly_pmi = loan_amount * pmi_rate / 100 / 12
+    
+        total_monthly_payment = monthly_pi + monthly_tax + monthly_insurance + monthly_hoa + monthly_pmi
+        front_end_dti = total_monthly_payment / monthly_income
+        back_end_dti = (total_monthly_payment + existing_debt) / monthly_income
+        ltv = loan_amount / home_price
+
+    # Risk assessment
+    risk_score = calculate_risk_score(back_end_dti, ltv, credit_score)
+    risk_label, risk_color = get_risk_label_and_color(risk_score)
+    risk_guidance = get_risk_guidance(risk_label, ltv, back_end_dti)
+
+    # Total interest over life
+    total_interest = (monthly_pi * total_months) - loan_amount
+    
+    return {
+        'monthly_income': monthly_income,
+        'max_payment_constraint': max_payment_constraint,
+        'home_price': home_price,
+        'max_affordable_price': max_affordable_price,
+        'loan_amount': loan_amount,
+        'monthly_rate': monthly_rate,
+        'total_months': total_months,
+        'annuity': annuity,
+        'monthly_pi': monthly_pi,
+        'monthly_tax': monthly_tax,
+        'monthly_insurance': monthly_insurance,
+        'monthly_hoa': monthly_hoa,
+        'monthly_pmi': monthly_pmi,
+        'total_monthly_payment': total_monthly_payment,
+        'front_end_dti': front_end_dti,
+        'back_end_dti': back_end_dti,
+        'ltv': ltv,
+        'risk_score': risk_score,
+        'risk_label': risk_label,
+        'risk_color': risk_color,
+        'risk_guidance': risk_guidance,
+        'total_interest': total_interest
+    }
+
+# HTML report layout, filled in when the user generates a report
+_REPORT_TMPL = Template("""
+        <html>
+        <head><title>Mortgage Analysis Report</title></head>
+        <body style="font-family: Arial, sans-serif; margin: 20px;">
+        <h1>🏠 Mortgage Analysis Report</h1>
+        <p><strong>Generated:</strong> $generated</p>
+        
+        <h2>Summary</h2>
+        <table border="1" cellpadding="10">
+        <tr><td>Home Price</td><td>$home_price</td></tr>
+        <tr><td>Loan Amount</td><td>$loan_amount</td></tr>
+        <tr><td>Monthly Payment</td><td>$monthly_payment</td></tr>
+        <tr><td>Back-End DTI</td><td>$back_end_dti</td></tr>
+        <tr><td>LTV</td><td>$ltv</td></tr>
+        <tr><td>Risk Level</td><td style="color: $risk_color;">$risk_label</td></tr>
+        </table>
+        
+        <h2>Payment Breakdown</h2>
+        <ul>
+        <li>Principal & Interest: $monthly_pi</li>
+        <li>Property Tax: $monthly_tax</li>
+        <li>Insurance: $monthly_insurance</li>
+        <li>HOA: $monthly_hoa</li>
+        <li>PMI: $monthly_pmi</li>
+        </ul>
+        
+        <p><strong>Risk Guidance:</strong> $risk_guidance</p>
+        </body>
+        </html>
+        """)
+
 # Initialize session state
 if 'scenarios' not in st.session_state:
     st.session_state.scenarios = []
@@ -285,7 +454,57 @@ dp_step = st.sidebar.number_input(
 )
 
 # Action buttons
-if st.sidebar.button("Save Scenario"):
+save_scenario = st.sidebar.button("Save Scenario")
+
+if st.sidebar.button("Reset Inputs"):
+    st.rerun()
+
+# Cache diagnostics, only shown with ?debug=1 in the URL
+if st.query_params.get("debug") == "1":
+    with st.sidebar.expander("Cache Diagnostics"):
+        st.write(f"Amortization schedules: up to {_AMORTIZATION_CACHE_ENTRIES} cached, "
+                 f"expire after {_AMORTIZATION_CACHE_TTL // 60} minutes")
+        st.write(f"Mortgage calculations: up to {_MORTGAGE_CACHE_ENTRIES} cached")
+
+# Core calculations
+# Validate down payment
+if home_price and down_payment_amount >= home_price:
+    st.error("Down payment cannot be greater than or equal to home price")
+    st.stop()
+
+results = compute_mortgage(
+    annual_income, existing_debt, credit_score, home_price,
+    down_payment_amount, down_payment_percent, interest_rate, loan_term,
+    property_tax_rate, home_insurance, hoa_fees, pmi_rate,
+    max_front_dti, max_back_dti
+)
+
+monthly_income = results['monthly_income']
+max_payment_constraint = results['max_payment_constraint']
+home_price = results['home_price']
+max_affordable_price = results['max_affordable_price']
+loan_amount = results['loan_amount']
+monthly_rate = results['monthly_rate']
+total_months = results['total_months']
+annuity = results['annuity']
+monthly_pi = results['monthly_pi']
+monthly_tax = results['monthly_tax']
+monthly_insurance = results['monthly_insurance']
+monthly_hoa = results['monthly_hoa']
+monthly_pmi = results['monthly_pmi']
+total_monthly_payment = results['total_monthly_payment']
+front_end_dti = results['front_end_dti']
+back_end_dti = results['back_end_dti']
+ltv = results['ltv']
+risk_score = results['risk_score']
+risk_label = results['risk_label']
+risk_color = results['risk_color']
+risk_guidance = results['risk_guidance']
+total_interest = results['total_interest']
+
+# Record the scenario only once inputs are valid, so every saved scenario
+# gets its calculated values below
+if save_scenario:
     scenario = {
         'timestamp': datetime.now().strftime("%H:%M:%S"),
         'annual_income': annual_income,
@@ -302,141 +521,20 @@ if st.sidebar.button("Save Scenario"):
         st.session_state.scenarios.pop(0)
     st.sidebar.success("Scenario saved!")
 
-if st.sidebar.button("Reset Inputs"):
-    st.rerun()
-
-# Core calculations
-monthly_income = annual_income / 12
-
-# Calculate based on mode
-if price_mode == "Set Home Price" and home_price:
-    # User set price - calculate affordability
-    loan_amount = home_price - down_payment_amount
-    
-    # Validate down payment
-    if down_payment_amount >= home_price:
-        st.error("Down payment cannot be greater than or equal to home price")
-        st.stop()
-    
-    # Monthly P&I
-    monthly_rate = interest_rate / 100 / 12
-    total_months = loan_term * 12
-    monthly_pi = pmt(monthly_rate, total_months, loan_amount)
-    
-    # Other monthly costs
-    monthly_tax = home_price * property_tax_rate / 100 / 12
-    monthly_insurance = home_insurance / 12
-    monthly_hoa = hoa_fees
-    
-    # PMI if down payment < 20%
-    monthly_pmi = 0
-    if down_payment_percent < 20:
-        monthly_pmi = loan_amount * pmi_rate / 100 / 12
-    
-    total_monthly_payment = monthly_pi + monthly_tax + monthly_insurance + monthly_hoa + monthly_pmi
-    
-    # DTI calculations
-    front_end_dti = total_monthly_payment / monthly_income
-    back_end_dti = (total_monthly_payment + existing_debt) / monthly_income
-    
-    # LTV
-    ltv = loan_amount / home_price
-    
-    max_affordable_price = home_price  # Same as set price
-    
-else:
-    # Find maximum affordability
-    # Max payment based on DTI constraints
-    max_payment_front = monthly_income * max_front_dti
-    max_payment_back = monthly_income * max_back_dti - existing_debt
-    max_payment_constraint = min(max_payment_front, max_payment_back)
-    
-    # Ensure positive payment constraint
-    if max_payment_constraint <= 0:
-        max_payment_constraint = 1000  # Minimum payment to prevent errors
-    
-    # Estimate other costs as percentage of price to solve iteratively
-    # Assume price P, then other costs are functions of P
-    # Total payment = PI + Tax + Insurance + HOA + PMI
-    # PI comes from loan amount = P - down_payment
-    
-    # Simple affordability calculation - estimate max loan from max payment
-    # Estimate non-P&I costs as percentage of payment for initial guess
-    estimated_other_costs = home_insurance / 12 + hoa_fees  # Fixed costs
-    available_for_pi_and_tax = max_payment_constraint - estimated_other_costs
-    
-    # Estimate price iteratively
-    monthly_rate = interest_rate / 100 / 12
-    total_months = loan_term * 12
-    
-    # Start with a reasonable guess
-    estimated_price = max(down_payment_amount * 4, 200000)
-    
-    for _ in range(15):  # More iterations for stability
-        estimated_loan = max(estimated_price - down_payment_amount, 1000)
-        
-        # Calculate all components
-        monthly_pi = pmt(monthly_rate, total_months, estimated_loan)
-        monthly_tax = estimated_price * property_tax_rate / 100 / 12
-        monthly_insurance = home_insurance / 12
-        monthly_hoa = hoa_fees
-        
-        # PMI calculation
-        monthly_pmi = 0
-        if estimated_price > 0 and down_payment_amount / estimated_price < 0.20:
-            monthly_pmi = estimated_loan * pmi_rate / 100 / 12
-        
-        estimated_total = monthly_pi + monthly_tax + monthly_insurance + monthly_hoa + monthly_pmi
-        
-        # Check convergence
-        if abs(estimated_total - max_payment_constraint) < 5:
-            break
-            
-        # Adjust estimate - be more conservative with adjustments
-        if estimated_total > max_payment_constraint:
-            estimated_price *= 0.95  # Reduce price
-        else:
-            estimated_price *= 1.02  # Increase price slightly
-        
-        # Ensure price stays reasonable
-        estimated_price = max(estimated_price, down_payment_amount + 10000)
-    
-    # Set calculated values
-    home_price = max(estimated_price, down_payment_amount + 1000)
-    max_affordable_price = home_price
-    loan_amount = home_price - down_payment_amount
-    
-    # Recalculate final values with fresh variables
-    monthly_rate = interest_rate / 100 / 12
-    total_months = loan_term * 12
-    monthly_pi = pmt(monthly_rate, total_months, loan_amount)
-    monthly_tax = home_price * property_tax_rate / 100 / 12
-    monthly_insurance = home_insurance / 12
-    monthly_hoa = hoa_fees
-    
-    monthly_pmi = 0
-    if down_payment_amount / home_price < 0.20:
-        monthly_pmi = loan_amount * pmi_rate / 100 / 12
-    
-    total_monthly_payment = monthly_pi + monthly_tax + monthly_insurance + monthly_hoa + monthly_pmi
-    front_end_dti = total_monthly_payment / monthly_income
-    back_end_dti = (total_monthly_payment + existing_debt) / monthly_income
-    ltv = loan_amount / home_price
-
-# Risk assessment
-risk_score = calculate_risk_score(back_end_dti, ltv, credit_score)
-risk_label, risk_color = get_risk_label_and_color(risk_score)
-risk_guidance = get_risk_guidance(risk_label, ltv, back_end_dti)
-
-# Total interest over life
-total_interest = (monthly_pi * loan_term * 12) - loan_amount
-
 # Update scenario with calculated values
 if st.session_state.scenarios:
     st.session_state.scenarios[-1].update({
+        'home_price': home_price,
         'monthly_payment': total_monthly_payment,
         'back_end_dti': back_end_dti,
-        'ltv': ltv
+        'ltv': ltv,
+        # Pre-formatted values for the scenario comparison table
+        'display': {
+            'home_price': to_currency(home_price),
+            'monthly_payment': to_currency(total_monthly_payment),
+            'back_end_dti': to_percent(back_end_dti * 100),
+            'ltv': to_percent(ltv * 100)
+        }
     })
 
 # Main layout
@@ -491,8 +589,7 @@ with tab1:
         ]
     }
     
-    payment_df = pd.DataFrame(payment_data)
-    st.dataframe(payment_df, use_container_width=True)
+    st.table(payment_data)
     
     # DTI and affordability metrics
     col1, col2 = st.columns(2)
@@ -521,33 +618,29 @@ with tab1:
     if len(st.session_state.scenarios) >= 2:
         st.subheader("Scenario Comparison")
         
-        scenarios_df = pd.DataFrame(st.session_state.scenarios[-2:])
-        scenarios_df.index = ['Previous', 'Current']
-        
         comparison_cols = ['home_price', 'monthly_payment', 'back_end_dti', 'ltv']
-        for col in comparison_cols:
-            if col in scenarios_df.columns:
-                scenarios_df[col] = scenarios_df[col].apply(
-                    lambda x: to_currency(x) if 'price' in col or 'payment' in col 
-                    else to_percent(x * 100) if 'dti' in col or 'ltv' in col 
-                    else x
-                )
+        scenarios_df = pd.DataFrame.from_dict(
+            {
+                'Previous': st.session_state.scenarios[-2]['display'],
+                'Current': st.session_state.scenarios[-1]['display']
+            },
+            orient='index',
+            columns=comparison_cols
+        )
         
-        st.dataframe(scenarios_df[comparison_cols], use_container_width=True)
+        st.dataframe(scenarios_df, use_container_width=True)
 
 with tab2:
     # Payment composition pie chart
     st.subheader("Monthly Payment Composition")
     
-    pie_data = {
-        'Component': ['Principal & Interest', 'Property Tax', 'Insurance', 'HOA', 'PMI'],
-        'Amount': [monthly_pi, monthly_tax, monthly_insurance, monthly_hoa, monthly_pmi]
-    }
+    components = ['Principal & Interest', 'Property Tax', 'Insurance', 'HOA', 'PMI']
+    amounts = [monthly_pi, monthly_tax, monthly_insurance, monthly_hoa, monthly_pmi]
     
-    pie_df = pd.DataFrame(pie_data)
-    pie_df = pie_df[pie_df['Amount'] > 0]  # Remove zero components
+    # Remove zero components
+    pie_names, pie_values = zip(*[(c, a) for c, a in zip(components, amounts) if a > 0])
     
-    fig_pie = px.pie(pie_df, values='Amount', names='Component', 
+    fig_pie = px.pie(values=list(pie_values), names=list(pie_names), 
                      title="Payment Breakdown")
     st.plotly_chart(fig_pie, use_container_width=True)
     
@@ -558,29 +651,33 @@ with tab2:
     
     # Show first 120 months prominently, rest faintly
     fig_balance = go.Figure()
+    # float32 is plenty for a chart and halves the data sent to the browser
+    months = amortization['Month'].values
+    balances = amortization['Ending Balance'].values.astype(np.float32)
     
     if len(amortization) > 120:
         # First 10 years
         fig_balance.add_trace(go.Scatter(
-            x=amortization.iloc[:120]['Month'],
-            y=amortization.iloc[:120]['Ending Balance'],
+            x=months[:120],
+            y=balances[:120],
             mode='lines',
             name='First 10 Years',
             line=dict(width=3, color='blue')
         ))
         
-        # Remaining years (faint)
+        # Remaining years (faint), one point per quarter plus the payoff month
+        tail = np.unique(np.append(np.arange(120, len(months), 3), len(months) - 1))
         fig_balance.add_trace(go.Scatter(
-            x=amortization.iloc[120:]['Month'],
-            y=amortization.iloc[120:]['Ending Balance'],
+            x=months[tail],
+            y=balances[tail],
             mode='lines',
             name='Remaining Years',
             line=dict(width=1, color='lightblue', dash='dot')
         ))
     else:
         fig_balance.add_trace(go.Scatter(
-            x=amortization['Month'],
-            y=amortization['Ending Balance'],
+            x=months,
+            y=balances,
             mode='lines',
             name='Loan Balance',
             line=dict(width=3, color='blue')
@@ -603,20 +700,15 @@ with tab2:
     with col1:
         st.write("**Interest Rate Impact on Affordable Price**")
         
-        rates = [interest_rate - rate_step * 2, interest_rate - rate_step, 
-                interest_rate, interest_rate + rate_step, interest_rate + rate_step * 2]
-        prices = []
+        rates = interest_rate + rate_step * np.arange(-2, 3)
+        monthly_rates_sens = rates / 100 / 12
         
-        for rate in rates:
-            # Simplified calculation for sensitivity
-            monthly_rate_sens = rate / 100 / 12
-            max_pi = max_payment_constraint - (monthly_tax + monthly_insurance + monthly_hoa)
-            if monthly_rate_sens > 0:
-                max_loan_sens = invert_pmt(max_pi, monthly_rate_sens, loan_term * 12)
-                max_price_sens = max_loan_sens + down_payment_amount
-                prices.append(max_price_sens)
-            else:
-                prices.append(max_affordable_price)
+        # Simplified calculation for sensitivity, evaluated for all rates at once
+        max_pi = max_payment_constraint - (monthly_tax + monthly_insurance + monthly_hoa)
+        positive = monthly_rates_sens > 0
+        safe_rates = np.where(positive, monthly_rates_sens, 1)
+        max_loans_sens = max_pi * (1 - (1 + safe_rates) ** -total_months) / safe_rates
+        prices = np.where(positive, max_loans_sens + down_payment_amount, max_affordable_price)
         
         sens_df = pd.DataFrame({'Rate (%)': rates, 'Max Price ($)': prices})
         fig_rate = px.line(sens_df, x='Rate (%)', y='Max Price ($)', 
@@ -628,26 +720,21 @@ with tab2:
     with col2:
         st.write("**Down Payment Impact on Monthly Payment**")
         
-        dp_percents = [max(0, down_payment_percent - dp_step * 2),
-                      max(0, down_payment_percent - dp_step),
-                      down_payment_percent,
-                      min(50, down_payment_percent + dp_step),
-                      min(50, down_payment_percent + dp_step * 2)]
+        dp_percents = np.array([max(0, down_payment_percent - dp_step * 2),
+                                max(0, down_payment_percent - dp_step),
+                                down_payment_percent,
+                                min(50, down_payment_percent + dp_step),
+                                min(50, down_payment_percent + dp_step * 2)])
+        
+        dp_amounts_sens = home_price * dp_percents / 100
+        loan_amounts_sens = home_price - dp_amounts_sens
+        monthly_pis_sens = loan_amounts_sens / annuity
         
-        payments = []
-        for dp_pct in dp_percents:
-            dp_amount_sens = home_price * dp_pct / 100
-            loan_amount_sens = home_price - dp_amount_sens
-            monthly_pi_sens = pmt(monthly_rate, total_months, loan_amount_sens)
-            
-            # PMI adjustment
-            monthly_pmi_sens = 0
-            if dp_pct < 20:
-                monthly_pmi_sens = loan_amount_sens * pmi_rate / 100 / 12
-            
-            total_payment_sens = (monthly_pi_sens + monthly_tax + 
-                                monthly_insurance + monthly_hoa + monthly_pmi_sens)
-            payments.append(total_payment_sens)
+        # PMI adjustment
+        monthly_pmis_sens = np.where(dp_percents < 20, loan_amounts_sens * pmi_rate / 100 / 12, 0)
+        
+        payments = (monthly_pis_sens + monthly_tax + 
+                    monthly_insurance + monthly_hoa + monthly_pmis_sens)
         
         dp_df = pd.DataFrame({'Down Payment (%)': dp_percents, 'Monthly Payment ($)': payments})
         fig_dp = px.line(dp_df, x='Down Payment (%)', y='Monthly Payment ($)',
@@ -702,7 +789,10 @@ col1, col2 = st.columns(2)
 
 with col1:
     if st.button("Download Amortization Schedule"):
-        csv = amortization.to_csv(index=False)
+        buf = io.BytesIO()
+        np.savetxt(buf, amortization.to_numpy(), fmt=['%d'] + ['%.2f'] * 5, delimiter=',',
+                   header=','.join(amortization.columns), comments='')
+        csv = buf.getvalue()
         st.download_button(
             label="📥 Download CSV",
             data=csv,
@@ -713,36 +803,22 @@ with col1:
 with col2:
     if st.button("Generate Report"):
         # Create HTML report
-        report_html = f"""
-        <html>
-        <head><title>Mortgage Analysis Report</title></head>
-        <body style="font-family: Arial, sans-serif; margin: 20px;">
-        <h1>🏠 Mortgage Analysis Report</h1>
-        <p><strong>Generated:</strong> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-        
-        <h2>Summary</h2>
-        <table border="1" cellpadding="10">
-        <tr><td>Home Price</td><td>{to_currency(home_price)}</td></tr>
-        <tr><td>Loan Amount</td><td>{to_currency(loan_amount)}</td></tr>
-        <tr><td>Monthly Payment</td><td>{to_currency(total_monthly_payment)}</td></tr>
-        <tr><td>Back-End DTI</td><td>{to_percent(back_end_dti * 100)}</td></tr>
-        <tr><td>LTV</td><td>{to_percent(ltv * 100)}</td></tr>
-        <tr><td>Risk Level</td><td style="color: {risk_color};">{risk_label}</td></tr>
-        </table>
-        
-        <h2>Payment Breakdown</h2>
-        <ul>
-        <li>Principal & Interest: {to_currency(monthly_pi)}</li>
-        <li>Property Tax: {to_currency(monthly_tax)}</li>
-        <li>Insurance: {to_currency(monthly_insurance)}</li>
-        <li>HOA: {to_currency(monthly_hoa)}</li>
-        <li>PMI: {to_currency(monthly_pmi)}</li>
-        </ul>
-        
-        <p><strong>Risk Guidance:</strong> {risk_guidance}</p>
-        </body>
-        </html>
-        """
+        report_html = _REPORT_TMPL.substitute(
+            generated=datetime.now().strftime('%B %d, %Y at %I:%M %p'),
+            home_price=to_currency(home_price),
+            loan_amount=to_currency(loan_amount),
+            monthly_payment=to_currency(total_monthly_payment),
+            back_end_dti=to_percent(back_end_dti * 100),
+            ltv=to_percent(ltv * 100),
+            risk_color=risk_color,
+            risk_label=risk_label,
+            monthly_pi=to_currency(monthly_pi),
+            monthly_tax=to_currency(monthly_tax),
+            monthly_insurance=to_currency(monthly_insurance),
+            monthly_hoa=to_currency(monthly_hoa),
+            monthly_pmi=to_currency(monthly_pmi),
+            risk_guidance=risk_guidance
+        )
         
         st.download_button(
             label="📄 Download HTML Report",
@@ -750,22 +826,3 @@ with col2:
             file_name=f"mortgage_report_{datetime.now().strftime('%Y%m%d')}.html",
             mime="text/html"
         )
-
-# Smoke tests
-if __name__ == "__main__":
-    # Test basic payment calculation
-    test_payment = pmt(0.065/12, 30*12, 320000)
-    expected_payment = 2021.84  # Known value for 6.5%, 30yr, $320k loan
-    
-    print(f"Smoke Test - Payment Calculation:")
-    print(f"  Calculated: ${test_payment:.2f}")
-    print(f"  Expected: ${expected_payment:.2f}")
-    print(f"  Difference: ${abs(test_payment - expected_payment):.2f}")
-    print(f"  Test {'PASSED' if abs(test_payment - expected_payment) < 1.0 else 'FAILED'}")
-    
-    # Test risk score calculation
-    test_risk = calculate_risk_score(0.36, 0.8, "720-759")
-    print(f"\nSmoke Test - Risk Score:")
-    print(f"  DTI: 36%, LTV: 80%, Credit: 720-759")
-    print(f"  Risk Score: {test_risk:.1f}")
-    print(f"  Test {'PASSED' if 30 <= test_risk <= 60 else 'FAILED'}")
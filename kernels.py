@@ -0,0 +1,50 @@
+"""Numeric kernels for the calculator.
+
+Kept out of app.py so they are defined once per process: Streamlit
+re-executes the app script on every rerun, which would rebuild the
+lru_cache and Numba dispatchers each time, and a Numba-cached kernel has
+to live in a module that can be re-imported without running the app.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernels run as plain NumPy without it
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+
+@lru_cache(maxsize=512)
+def _annuity_factor(rate, nper):
+    """Present value of 1 paid per period, cached per (rate, term) pair"""
+    if rate == 0:
+        return nper
+    return (1 - (1 + rate) ** -nper) / rate
+
+
+def annuity_factor(rate, nper):
+    """Annuity factor with the rate rounded so float noise doesn't miss the cache"""
+    return _annuity_factor(round(rate, 12), nper)
+
+
+def pmt(rate, nper, pv):
+    """Calculate monthly payment using standard mortgage formula"""
+    return pv / annuity_factor(rate, nper)
+
+
+def invert_pmt(payment, rate, nper):
+    """Calculate loan amount from monthly payment"""
+    return payment * annuity_factor(rate, nper)
+
+
+@njit(cache=True)
+def amortization_balances(loan_amount, monthly_rate, monthly_payment, total_months):
+    """Ending balance after each payment, from the closed form
+    B_k = B0*(1+r)^k - M*((1+r)^k - 1)/r"""
+    months = np.arange(1, total_months + 1)
+    if monthly_rate == 0:
+        return loan_amount - monthly_payment * months
+    growth = (1 + monthly_rate) ** months
+    return loan_amount * growth - monthly_payment * (growth - 1) / monthly_rate
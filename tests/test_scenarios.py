@@ -0,0 +1,30 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def _sidebar_button(at, label):
+    return next(b for b in at.sidebar.button if b.label == label)
+
+
+def _down_payment_input(at):
+    return next(n for n in at.sidebar.number_input if n.label == "Down Payment ($)")
+
+
+def test_save_scenario_with_invalid_down_payment_is_not_recorded():
+    at = AppTest.from_file(APP_PATH, default_timeout=60).run()
+    _sidebar_button(at, "Save Scenario").click().run()
+
+    # Down payment >= home price stops the script before any calculations
+    _down_payment_input(at).set_value(500000).run()
+    _sidebar_button(at, "Save Scenario").click().run()
+    _sidebar_button(at, "Save Scenario").click().run()
+    assert len(at.session_state["scenarios"]) == 1
+
+    _down_payment_input(at).set_value(80000).run()
+    _sidebar_button(at, "Save Scenario").click().run()
+    assert not at.exception
+    assert all('display' in scenario for scenario in at.session_state["scenarios"])
+    assert len(at.dataframe) == 1  # Scenario comparison table
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+def test_payment_calculation():
+    # Known value for 6.5%, 30yr, $320k loan
+    test_payment = app.pmt(0.065 / 12, 30 * 12, 320000)
+    assert test_payment == pytest.approx(2021.84, abs=1.0)
+
+
+def test_risk_score():
+    # DTI: 36%, LTV: 80%, Credit: 720-759
+    test_risk = app.calculate_risk_score(0.36, 0.8, "720-759")
+    assert test_risk == pytest.approx(66.0)
+
+
+@pytest.mark.parametrize("risk_score, label", [
+    (0, "Low"),
+    (24.9, "Low"),
+    (25, "Moderate"),
+    (50, "High"),
+    (74.9, "High"),
+    (75, "Very High"),
+    (100, "Very High"),
+])
+def test_risk_label_thresholds(risk_score, label):
+    assert app.get_risk_label_and_color(risk_score)[0] == label